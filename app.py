@@ -1,13 +1,19 @@
 import os
-import json
+import sys
+import time
+import orjson
 import logging
 import asyncio
-from datetime import datetime, timedelta
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, status, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
 from auth import authenticate_user, create_access_token, verify_token, token_blacklist
 from heartbeat import register_client, remove_client, heartbeat_checker, connected_clients
+from timeutils import iso_now, monotonic_to_datetime
+from settings import WS_MAX_SIZE
 from data_handler import handle_data_reception, handle_parent_command
+import broker
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,82 +23,158 @@ app = FastAPI(title="Watch Server",
               description="Parent-Child Monitoring Server",
               version="1.0.0",
               docs_url="/docs" if os.environ.get("DEBUG", "false").lower() == "true" else None,
-              redoc_url=None)
+              redoc_url=None,
+              default_response_class=ORJSONResponse)
 
 # Production CORS
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=json.loads(os.environ.get("CORS_ORIGINS", '["http://localhost:3000", "http://127.0.0.1:3000"]')),
+    allow_origins=orjson.loads(os.environ.get("CORS_ORIGINS", '["http://localhost:3000", "http://127.0.0.1:3000"]')),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
-# Security headers middleware
-@app.middleware("http")
-async def add_security_headers(request, call_next):
-    response = await call_next(request)
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    return response
+# Security headers middleware (pure ASGI, headers encoded once at startup)
+class SecurityHeadersMiddleware:
+    def __init__(self, app, headers: dict):
+        self.app = app
+        self.raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                            for name, value in headers.items()]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + self.raw_headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+app.add_middleware(
+    SecurityHeadersMiddleware,
+    headers={
+        "X-Content-Type-Options": "nosniff",
+        "X-Frame-Options": "DENY",
+        "X-XSS-Protection": "1; mode=block",
+        "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    },
+)
+
+# Static JSON bodies, pre-serialized around the timestamp value
+_TIMESTAMP_PLACEHOLDER = "__timestamp__"
+
+def _json_template(body: dict):
+    """Split a serialized body into (prefix, suffix) around its timestamp"""
+    prefix, suffix = orjson.dumps(body).split(orjson.dumps(_TIMESTAMP_PLACEHOLDER))
+    return prefix, suffix
+
+def _render_template(template, cache: list):
+    """Splice the current timestamp into a template, rebuilt at most once per second"""
+    now = int(time.time())
+    if cache[0] != now:
+        prefix, suffix = template
+        cache[0] = now
+        cache[1] = prefix + orjson.dumps(iso_now()) + suffix
+    return Response(content=cache[1], media_type="application/json")
+
+_ROOT_TEMPLATE = _json_template({
+    "message": "Watch Server is running", 
+    "status": "production",
+    "version": "1.0.0",
+    "timestamp": _TIMESTAMP_PLACEHOLDER,
+    "endpoints": {
+        "health": "/health",
+        "auth": "/auth", 
+        "clients": "/clients",
+        "websocket": "/ws/{client_id}"
+    }
+})
+_root_cache = [0, b""]
+
+_HEALTH_TEMPLATE = _json_template({
+    "status": "healthy", 
+    "server": "Watch Server",
+    "timestamp": _TIMESTAMP_PLACEHOLDER,
+    "version": "1.0.0"
+})
+_health_cache = [0, b""]
 
 # Root endpoint
 @app.get("/")
 async def root():
-    return {
-        "message": "Watch Server is running", 
-        "status": "production",
-        "version": "1.0.0",
-        "timestamp": datetime.now().isoformat(),
-        "endpoints": {
-            "health": "/health",
-            "auth": "/auth", 
-            "clients": "/clients",
-            "websocket": "/ws/{client_id}"
-        }
-    }
+    return _render_template(_ROOT_TEMPLATE, _root_cache)
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy", 
-        "server": "Watch Server",
-        "timestamp": datetime.now().isoformat(),
-        "version": "1.0.0"
-    }
+    return _render_template(_HEALTH_TEMPLATE, _health_cache)
+
+# Serialized /clients body, rebuilt at most once per second
+CLIENTS_SNAPSHOT_TTL = 1.0
+_clients_snapshot = {"bytes": b"", "ts": float("-inf")}
 
 # Connected clients endpoint
 @app.get("/clients")
 async def get_connected_clients():
     """Get list of currently connected clients"""
+    now = time.monotonic()
+    if now - _clients_snapshot["ts"] < CLIENTS_SNAPSHOT_TTL:
+        return Response(content=_clients_snapshot["bytes"], media_type="application/json")
+    
     clients_info = []
     for client_id, client_data in connected_clients.items():
         clients_info.append({
             "client_id": client_id,
-            "user_type": client_data.get('user_type', 'unknown'),
-            "last_heartbeat": client_data.get('last_heartbeat'),
-            "connection_time": client_data.get('connection_time')
+            "user_type": client_data.user_type,
+            "last_heartbeat": monotonic_to_datetime(client_data.last_heartbeat_mono),
+            "connection_time": monotonic_to_datetime(client_data.connection_time_mono)
         })
-    return {
+    _clients_snapshot["bytes"] = orjson.dumps({
         "clients": clients_info, 
         "count": len(clients_info),
         "server": "Watch Server"
-    }
+    })
+    _clients_snapshot["ts"] = now
+    return Response(content=_clients_snapshot["bytes"], media_type="application/json")
 
 # WebSocket connections
 active_connections = {}
 
+async def receive_frame(websocket: WebSocket):
+    """Receive a raw frame (binary UTF-8 JSON, or text for older clients)"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", status.WS_1000_NORMAL_CLOSURE))
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    return message.get("text")
+
+def frame_too_large(data):
+    """Whether a frame exceeds WS_MAX_SIZE bytes, text frames are measured as UTF-8"""
+    if isinstance(data, str):
+        # UTF-8 needs 1 to 4 bytes per character, only encode when the length is ambiguous
+        if len(data) * 4 <= WS_MAX_SIZE:
+            return False
+        if len(data) > WS_MAX_SIZE:
+            return True
+        return len(data.encode()) > WS_MAX_SIZE
+    return len(data) > WS_MAX_SIZE
+
 @app.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
     try:
         await websocket.accept()
         
         # Wait for authentication token as first message
-        auth_message = await websocket.receive_text()
-        auth_data = json.loads(auth_message)
+        auth_message = await receive_frame(websocket)
+        if frame_too_large(auth_message):
+            await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+            return
+        auth_data = orjson.loads(auth_message)
         
         token = auth_data.get('token')
         if not token:
@@ -110,10 +192,11 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         
         # Register client
         register_client(client_id, websocket, user_type)
+        await broker.announce_client(client_id, user_type)
         logger.info(f"✅ {user_type.capitalize()} client connected: {client_id} (User: {username})")
         
         # Send connection confirmation
-        await websocket.send_text(json.dumps({
+        await websocket.send_bytes(orjson.dumps({
             "status": "connected",
             "client_id": client_id,
             "user_type": user_type,
@@ -124,21 +207,25 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
         try:
             while True:
                 # Receive data from client
-                data = await websocket.receive_text()
-                data_dict = json.loads(data)
+                data = await receive_frame(websocket)
+                if frame_too_large(data):
+                    logger.warning("⚠️ Frame over %s bytes from %s", WS_MAX_SIZE, client_id)
+                    await websocket.close(code=status.WS_1009_MESSAGE_TOO_BIG)
+                    break
                 
                 # Handle based on user type
                 if user_type == 'child':
-                    await handle_data_reception(websocket, client_id, data_dict)
+                    await handle_data_reception(websocket, client_id, data)
                 elif user_type == 'parent':
-                    await handle_parent_command(websocket, client_id, data_dict)
+                    await handle_parent_command(websocket, client_id, data)
                     
         except WebSocketDisconnect:
             logger.info(f"🔌 Client disconnected: {client_id}")
-            remove_client(client_id)
         except Exception as e:
             logger.error(f"❌ Error with client {client_id}: {str(e)}")
+        finally:
             remove_client(client_id)
+            await broker.withdraw_client(client_id)
             
     except Exception as e:
         logger.error(f"❌ WebSocket connection error: {str(e)}")
@@ -150,7 +237,8 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
 @app.post("/auth")
 async def login(username: str, password: str):
     """Authenticate user and return JWT token"""
-    user = authenticate_user(username, password)
+    # bcrypt is CPU-bound, keep it off the event loop
+    user = await run_in_threadpool(authenticate_user, username, password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
@@ -188,13 +276,23 @@ async def logout(token: str):
 @app.on_event("startup")
 async def startup_event():
     # Start heartbeat checker
-    asyncio.create_task(heartbeat_checker())
+    # Timed-out clients also give up their cross-worker routing
+    asyncio.create_task(heartbeat_checker(on_timeout=broker.withdraw_client))
+    # Connect to Redis for cross-worker routing (if REDIS_URL is set)
+    await broker.start()
     logger.info("🚀 Watch Server started successfully in production mode")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await broker.stop()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
     host = os.environ.get("HOST", "0.0.0.0")
     debug = os.environ.get("DEBUG", "false").lower() == "true"
     
-    uvicorn.run(app, host=host, port=port, log_level="info" if not debug else "debug")
\ No newline at end of file
+    # uvloop is not available on Windows, fall back to uvicorn's default there
+    uvicorn.run(app, host=host, port=port, log_level="info" if not debug else "debug",
+                loop="uvloop" if sys.platform != "win32" else "auto",
+                http="httptools", ws="websockets", ws_max_size=WS_MAX_SIZE)
\ No newline at end of file
@@ -1,17 +1,28 @@
 import os
+import hashlib
+import threading
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from passlib.context import CryptContext
+from cachetools import TTLCache
 
 # Environment variables - REQUIRED in production
 SECRET_KEY = os.environ["SECRET_KEY"]  # Must be set in production
 ALGORITHM = os.environ.get("ALGORITHM", "HS256")
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", 8))
 
 # Token blacklist for logout functionality
 token_blacklist = set()
 
+# Verified credentials cache (successful logins only, keyed by hash)
+_cred_cache = TTLCache(maxsize=1024, ttl=60)
+_cred_cache_lock = threading.Lock()  # authenticate_user runs in a threadpool
+
+# Verified tokens cache (keyed by token hash, short TTL)
+_token_cache = TTLCache(maxsize=10000, ttl=5)
+
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS, deprecated="auto")
 
 # User database
 users_db = {
@@ -23,13 +34,16 @@ users_db = {
     }
 }
 
+# All child users share the same password, so hash it only once
+_child_hashed_password = pwd_context.hash("Splender#@9750")
+
 # Add child users (1 to 30)
 for i in range(1, 31):
     username = f"chaild{i}"
     users_db[username] = {
         "username": username,
         "full_name": f"Child User {i}",
-        "hashed_password": pwd_context.hash("Splender#@9750"),
+        "hashed_password": _child_hashed_password,
         "role": "child"
     }
 
@@ -37,11 +51,21 @@ def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def authenticate_user(username: str, password: str):
+    key = hashlib.sha256(f"{username}:{password}".encode()).hexdigest()
+    with _cred_cache_lock:
+        cached_user = _cred_cache.get(key)
+    if cached_user is not None:
+        return cached_user
+    
     if username not in users_db:
         return False
     user = users_db[username]
     if not verify_password(password, user["hashed_password"]):
         return False
+    
+    # Only cache successful verifications
+    with _cred_cache_lock:
+        _cred_cache[key] = user
     return user
 
 def create_access_token(data: dict):
@@ -66,6 +90,11 @@ def verify_token(token: str):
         # Check if token is blacklisted
         if token in token_blacklist:
             return None
+        
+        token_hash = hashlib.sha256(token.encode()).digest()
+        cached_user = _token_cache.get(token_hash)
+        if cached_user is not None:
+            return cached_user
             
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -77,6 +106,9 @@ def verify_token(token: str):
         if expire_timestamp and datetime.utcnow().timestamp() > expire_timestamp:
             return None
             
-        return users_db.get(username)
+        user = users_db.get(username)
+        if user is not None:
+            _token_cache[token_hash] = user
+        return user
     except JWTError:
         return None
\ No newline at end of file
@@ -0,0 +1,205 @@
+import os
+import uuid
+import asyncio
+import logging
+import redis.asyncio as aioredis
+from heartbeat import connected_clients, parent_clients
+
+# Logging is configured once in app.py
+logger = logging.getLogger(__name__)
+
+# Cross-worker routing is only enabled when a Redis URL is configured
+REDIS_URL = os.environ.get("REDIS_URL")
+STALE_SWEEP_INTERVAL = 60
+LISTENER_IDLE_INTERVAL = 0.5  # seconds to wait while nothing is subscribed
+
+# Unique id of this worker process
+WORKER_ID = uuid.uuid4().hex.encode()
+
+# Only workers with local parents subscribe, so PUBLISH counts them
+PARENTS_CHANNEL = "ws:parents"
+
+redis_client = None
+pubsub = None
+
+# Local clients subscribed to their relay channel
+_announced_clients = set()
+_announced_parents = set()
+_background_tasks = []
+# Cleared on stop, get_message can swallow a task cancellation
+_running = False
+
+def _client_channel(client_id: str):
+    return f"ws:client:{client_id}"
+
+def enabled():
+    """
+    Whether messages are routed across workers
+    """
+    return redis_client is not None
+
+async def start():
+    """
+    Connect to Redis and start the listener and stale client sweep tasks
+    """
+    global redis_client, pubsub, _running
+    if not REDIS_URL:
+        return
+    
+    redis_client = aioredis.from_url(REDIS_URL)
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    _running = True
+    _background_tasks.append(asyncio.create_task(_listener()))
+    _background_tasks.append(asyncio.create_task(_stale_client_sweeper()))
+    logger.info("✅ Cross-worker routing enabled via Redis")
+
+async def stop():
+    """
+    Unsubscribe local clients and close the Redis connection
+    """
+    global redis_client, pubsub, _running
+    if not enabled():
+        return
+    
+    _running = False
+    for task in _background_tasks:
+        task.cancel()
+    # Let the tasks finish before the connection they use goes away
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    
+    for client_id in list(_announced_clients):
+        await withdraw_client(client_id)
+    
+    await pubsub.aclose()
+    await redis_client.aclose()
+    redis_client = None
+    pubsub = None
+
+async def announce_client(client_id: str, user_type: str):
+    """
+    Subscribe to the client's relay channel so other workers can reach it
+    """
+    if not enabled():
+        return
+    try:
+        await pubsub.subscribe(_client_channel(client_id))
+        _announced_clients.add(client_id)
+        if user_type == 'parent':
+            _announced_parents.add(client_id)
+            if len(_announced_parents) == 1:
+                await pubsub.subscribe(PARENTS_CHANNEL)
+    except Exception as e:
+        logger.error("❌ Error announcing client %s: %s", client_id, e)
+
+async def withdraw_client(client_id: str):
+    """
+    Unsubscribe a client that is no longer connected to this worker
+    """
+    if not enabled() or client_id not in _announced_clients:
+        return
+    _announced_clients.discard(client_id)
+    try:
+        await pubsub.unsubscribe(_client_channel(client_id))
+        if client_id in _announced_parents:
+            _announced_parents.discard(client_id)
+            if not _announced_parents:
+                await pubsub.unsubscribe(PARENTS_CHANNEL)
+    except Exception as e:
+        logger.error("❌ Error withdrawing client %s: %s", client_id, e)
+
+async def publish_to_parents(payload_bytes: bytes):
+    """
+    Relay a serialized message to parents connected to other workers.
+    Returns the number of other workers with parents that received it.
+    """
+    if not enabled():
+        return 0
+    try:
+        receivers = await redis_client.publish(PARENTS_CHANNEL, WORKER_ID + b" " + payload_bytes)
+        # This worker is among the subscribers while it has local parents
+        if _announced_parents:
+            receivers -= 1
+        return max(receivers, 0)
+    except Exception as e:
+        logger.error("❌ Error publishing to parents: %s", e)
+        return 0
+
+async def publish_to_client(client_id: str, payload_bytes: bytes):
+    """
+    Relay a serialized message to a client connected to another worker.
+    Returns True if a worker subscribed to the client received it.
+    """
+    if not enabled():
+        return False
+    try:
+        return await redis_client.publish(_client_channel(client_id), payload_bytes) > 0
+    except Exception as e:
+        logger.error("❌ Error publishing to client %s: %s", client_id, e)
+        return False
+
+async def _deliver_to_parents(payload_bytes: bytes):
+    await asyncio.gather(
+        *(websocket.send_bytes(payload_bytes) for websocket in list(parent_clients.values())),
+        return_exceptions=True
+    )
+
+async def _deliver_to_client(client_id: str, payload_bytes: bytes):
+    client_data = connected_clients.get(client_id)
+    if client_data:
+        # A failing socket must not reach the listener's Redis back-off
+        try:
+            await client_data.websocket.send_bytes(payload_bytes)
+        except Exception as e:
+            logger.error("❌ Error delivering relayed message to %s: %s", client_id, e)
+    else:
+        logger.warning("⚠️ Dropped relayed message for disconnected client %s", client_id)
+
+async def _listener():
+    """
+    Deliver messages published by other workers to local websockets
+    """
+    while _running:
+        try:
+            # Nothing to read until the first local client subscribes
+            if not pubsub.subscribed:
+                await asyncio.sleep(LISTENER_IDLE_INTERVAL)
+                continue
+            
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Back off only when reading from Redis itself is failing
+            logger.error("❌ Error in Redis listener: %s", e)
+            await asyncio.sleep(1)
+            continue
+        
+        if message is None:
+            continue
+        
+        try:
+            channel = message["channel"].decode()
+            data = message["data"]
+            if channel == PARENTS_CHANNEL:
+                origin, _, payload_bytes = data.partition(b" ")
+                # Local parents were already served by the publishing worker
+                if origin != WORKER_ID:
+                    await _deliver_to_parents(payload_bytes)
+            else:
+                await _deliver_to_client(channel[len("ws:client:"):], data)
+        except Exception as e:
+            logger.error("❌ Error handling relayed message: %s", e)
+
+async def _stale_client_sweeper():
+    """
+    Withdraw subscribed clients that went away without being withdrawn
+    """
+    while _running:
+        await asyncio.sleep(STALE_SWEEP_INTERVAL)
+        try:
+            for client_id in list(_announced_clients):
+                if client_id not in connected_clients:
+                    await withdraw_client(client_id)
+        except Exception as e:
+            logger.error("❌ Error sweeping stale clients: %s", e)
\ No newline at end of file
@@ -1,78 +1,102 @@
-import json
+import orjson
+import asyncio
 import logging
-from datetime import datetime
-from heartbeat import connected_clients, update_heartbeat
+import msgspec
+from typing import Any
+from heartbeat import connected_clients, parent_clients, update_heartbeat
+from timeutils import iso_now
+import broker
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured once in app.py
 logger = logging.getLogger(__name__)
 
-async def handle_data_reception(websocket, client_id: str, data: dict):
+# Inbound message schemas, decoded straight from JSON
+class ChildMsg(msgspec.Struct):
+    type: str = 'unknown'
+    payload: Any = msgspec.field(default_factory=dict)
+
+class ParentMsg(msgspec.Struct):
+    command: str = 'unknown'
+    target_child: str = ''
+    payload: Any = msgspec.field(default_factory=dict)
+
+child_decoder = msgspec.json.Decoder(ChildMsg)
+parent_decoder = msgspec.json.Decoder(ParentMsg)
+
+# Data types forwarded from child devices to parents
+FORWARDED_DATA_TYPES = ('camera', 'microphone', 'screen', 'directory', 'files', 'location')
+
+# Pre-serialized acknowledgements, one per known data type
+_ACK_TMPL = {
+    data_type: orjson.dumps({
+        "status": "success", 
+        "type": f"{data_type}_ack",
+        "server": "Watch Server"
+    })
+    for data_type in ('heartbeat',) + FORWARDED_DATA_TYPES
+}
+
+async def handle_data_reception(websocket, client_id: str, frame):
     """
     Handle incoming data from child devices
     """
     try:
-        logger.info(f"📨 Received data from {client_id}: {data}")
+        # Decode inside the try so schema errors get an error reply
+        data = child_decoder.decode(frame)
+        logger.debug("📨 Received data from %s: %s", client_id, data)
         
-        # Update heartbeat
+        # Only well-formed messages count as a heartbeat
         update_heartbeat(client_id)
         
         # Extract data type and payload
-        data_type = data.get('type', 'unknown')
-        payload = data.get('payload', {})
-        
-        # Handle different data types
-        if data_type == 'heartbeat':
-            # Just update heartbeat, no further action needed
-            logger.debug(f"Heartbeat received from {client_id}")
-            response = {
-                "status": "success", 
-                "type": "heartbeat_ack",
-                "server": "Watch Server"
-            }
-            await websocket.send_text(json.dumps(response))
+        data_type = data.type
+        payload = data.payload
         
-        elif data_type in ['camera', 'microphone', 'screen', 'directory', 'files', 'location']:
-            await forward_to_parent(client_id, data_type, payload)
-            response = {
-                "status": "success", 
-                "type": f"{data_type}_ack",
-                "server": "Watch Server"
-            }
-            await websocket.send_text(json.dumps(response))
+        # Dispatch on data type with a single lookup
+        handler_ack = _HANDLERS.get(data_type)
+        if handler_ack is not None:
+            handler, ack = handler_ack
+            await handler(client_id, data_type, payload)
+            await websocket.send_bytes(ack)
         
         else:
-            logger.warning(f"❓ Unknown data type received from {client_id}: {data_type}")
+            logger.warning("❓ Unknown data type received from %s: %s", client_id, data_type)
             response = {
                 "status": "error", 
                 "message": f"Unknown data type: {data_type}",
                 "server": "Watch Server"
             }
-            await websocket.send_text(json.dumps(response))
+            await websocket.send_bytes(orjson.dumps(response))
     
     except Exception as e:
-        logger.error(f"❌ Error handling data from {client_id}: {str(e)}")
+        logger.error("❌ Error handling data from %s: %s", client_id, e)
         error_response = {
             "status": "error", 
             "message": f"Processing error: {str(e)}",
             "server": "Watch Server"
         }
-        await websocket.send_text(json.dumps(error_response))
+        await websocket.send_bytes(orjson.dumps(error_response))
 
-async def handle_parent_command(websocket, client_id: str, data: dict):
+async def _handle_heartbeat(client_id: str, data_type: str, payload: dict):
+    # Just update heartbeat, no further action needed
+    logger.debug("Heartbeat received from %s", client_id)
+
+async def handle_parent_command(websocket, client_id: str, frame):
     """
     Handle commands from parent to child devices
     """
     try:
-        logger.info(f"🎛️ Received command from parent {client_id}: {data}")
+        # Decode inside the try so schema errors get an error reply
+        data = parent_decoder.decode(frame)
+        logger.debug("🎛️ Received command from parent %s: %s", client_id, data)
         
-        # Update heartbeat
+        # Only well-formed messages count as a heartbeat
         update_heartbeat(client_id)
         
         # Extract command details
-        command = data.get('command', 'unknown')
-        target_child = data.get('target_child', '')
-        payload = data.get('payload', {})
+        command = data.command
+        target_child = data.target_child
+        payload = data.payload
         
         # Validate command
         if not target_child:
@@ -81,22 +105,28 @@ async def handle_parent_command(websocket, client_id: str, data: dict):
                 "message": "Target child not specified",
                 "server": "Watch Server"
             }
-            await websocket.send_text(json.dumps(error_response))
+            await websocket.send_bytes(orjson.dumps(error_response))
             return
         
-        # Find target child connection
+        message = {
+            'type': 'command',
+            'command': command,
+            'payload': payload,
+            'timestamp': iso_now(),
+            'from_parent': client_id,
+            'server': 'Watch Server'
+        }
+        
+        # Find target child connection, locally first, then on other workers
         if target_child in connected_clients:
-            child_conn = connected_clients[target_child]['websocket']
-            message = {
-                'type': 'command',
-                'command': command,
-                'payload': payload,
-                'timestamp': datetime.now().isoformat(),
-                'from_parent': client_id,
-                'server': 'Watch Server'
-            }
-            await child_conn.send_text(json.dumps(message))
-            logger.info(f"✅ Command {command} sent to {target_child}")
+            child_conn = connected_clients[target_child].websocket
+            await child_conn.send_bytes(orjson.dumps(message))
+            delivered = True
+        else:
+            delivered = await broker.publish_to_client(target_child, orjson.dumps(message))
+        
+        if delivered:
+            logger.info("✅ Command %s sent to %s", command, target_child)
             
             # Send success response to parent
             success_response = {
@@ -106,52 +136,66 @@ async def handle_parent_command(websocket, client_id: str, data: dict):
                 "target_child": target_child,
                 "server": "Watch Server"
             }
-            await websocket.send_text(json.dumps(success_response))
+            await websocket.send_bytes(orjson.dumps(success_response))
         else:
-            logger.warning(f"❌ Target child {target_child} not found for command {command}")
+            logger.warning("❌ Target child %s not found for command %s", target_child, command)
             error_response = {
                 "status": "error",
                 "message": f"Target child {target_child} not found or offline",
                 "server": "Watch Server"
             }
-            await websocket.send_text(json.dumps(error_response))
+            await websocket.send_bytes(orjson.dumps(error_response))
     
     except Exception as e:
-        logger.error(f"❌ Error handling parent command: {str(e)}")
+        logger.error("❌ Error handling parent command: %s", e)
         error_response = {
             "status": "error",
             "message": f"Error executing command: {str(e)}",
             "server": "Watch Server"
         }
-        await websocket.send_text(json.dumps(error_response))
+        await websocket.send_bytes(orjson.dumps(error_response))
 
 async def forward_to_parent(child_id: str, data_type: str, payload: dict):
     """
-    Forward data from child to parent
+    Forward data from child to all connected parents
     """
     try:
-        # Find parent connection
-        parent_conn = None
-        parent_id = None
+        if not parent_clients and not broker.enabled():
+            logger.warning("⚠️ No parent connection found to forward data from %s", child_id)
+            return
         
-        for client_id, client_data in connected_clients.items():
-            if client_data.get('user_type') == 'parent':
-                parent_conn = client_data['websocket']
-                parent_id = client_id
-                break
+        message = {
+            'type': data_type,
+            'from': child_id,
+            'payload': payload,
+            'timestamp': iso_now(),
+            'server': 'Watch Server'
+        }
+        # Serialize once and send to every parent concurrently
+        payload_bytes = orjson.dumps(message)
         
-        if parent_conn:
-            message = {
-                'type': data_type,
-                'from': child_id,
-                'payload': payload,
-                'timestamp': datetime.now().isoformat(),
-                'server': 'Watch Server'
-            }
-            await parent_conn.send_text(json.dumps(message))
-            logger.info(f"📤 Data forwarded from {child_id} to parent {parent_id}: {data_type}")
-        else:
-            logger.warning(f"⚠️ No parent connection found to forward data from {child_id}")
+        # Local sends and the Redis relay to other workers run together
+        parent_ids = list(parent_clients)
+        *results, remote_receivers = await asyncio.gather(
+            *(parent_clients[parent_id].send_bytes(payload_bytes) for parent_id in parent_ids),
+            broker.publish_to_parents(payload_bytes),
+            return_exceptions=True
+        )
+        for parent_id, result in zip(parent_ids, results):
+            if isinstance(result, Exception):
+                logger.error("❌ Error forwarding data to parent %s: %s", parent_id, result)
+            else:
+                logger.debug("📤 Data forwarded from %s to parent %s: %s", child_id, parent_id, data_type)
+        
+        if not parent_ids and not remote_receivers:
+            logger.warning("⚠️ No parent connection found to forward data from %s", child_id)
     
     except Exception as e:
-        logger.error(f"❌ Error forwarding data to parent: {str(e)}")
\ No newline at end of file
+        logger.error("❌ Error forwarding data to parent: %s", e)
+
+# Data type -> (handler, pre-serialized ack)
+_HANDLERS = {'heartbeat': (_handle_heartbeat, _ACK_TMPL['heartbeat'])}
+_HANDLERS.update({
+    data_type: (forward_to_parent, _ACK_TMPL[data_type])
+    for data_type in FORWARDED_DATA_TYPES
+})
\ No newline at end of file
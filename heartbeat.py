@@ -1,51 +1,86 @@
+import time
+import heapq
 import asyncio
 import logging
-from datetime import datetime
+from dataclasses import dataclass
+from typing import Any
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
+# Logging is configured once in app.py
 logger = logging.getLogger(__name__)
 
+# Seconds without a heartbeat before a client is considered disconnected
+HEARTBEAT_TIMEOUT = 150  # 2.5 minutes
+
+@dataclass(slots=True)
+class Client:
+    """
+    A connected client and its heartbeat state
+    """
+    websocket: Any
+    last_heartbeat_mono: float
+    connection_time_mono: float
+    user_type: str
+
 # Store connected clients and their last heartbeat
-connected_clients = {}
+connected_clients: dict[str, Client] = {}
 
-async def heartbeat_checker():
+# Index of websockets by user type for fast lookup
+parent_clients = {}
+child_clients = {}
+
+# Min-heap of (expiry_mono, client_id, connection_time_mono), one entry per registration
+expiry_heap = []
+
+async def heartbeat_checker(on_timeout=None):
     """
-    Check every 2 minutes if clients are still connected
+    Check every 2 minutes if clients are still connected.
+    on_timeout is an optional coroutine function awaited with each removed client_id.
     """
     while True:
         await asyncio.sleep(120)  # 2 minutes
-        current_time = datetime.now()
-        disconnected_clients = []
+        now = time.monotonic()
         
-        for client_id, client_data in connected_clients.items():
-            last_heartbeat = client_data.get('last_heartbeat')
-            if last_heartbeat and (current_time - last_heartbeat).total_seconds() > 150:  # 2.5 minutes
-                disconnected_clients.append(client_id)
+        # Only visit clients whose scheduled expiry has passed
+        while expiry_heap and expiry_heap[0][0] < now:
+            _, client_id, connection_time_mono = heapq.heappop(expiry_heap)
+            client_data = connected_clients.get(client_id)
+            if not client_data or client_data.connection_time_mono != connection_time_mono:
+                # Stale entry for a client that was removed or re-registered
+                continue
+            
+            expiry = client_data.last_heartbeat_mono + HEARTBEAT_TIMEOUT
+            if expiry < now:
                 logger.warning(f"Client {client_id} disconnected due to heartbeat timeout")
-        
-        # Remove disconnected clients
-        for client_id in disconnected_clients:
-            if client_id in connected_clients:
-                del connected_clients[client_id]
+                remove_client(client_id)
+                if on_timeout:
+                    await on_timeout(client_id)
+            else:
+                # Heartbeat arrived since scheduling, reschedule at the new expiry
+                heapq.heappush(expiry_heap, (expiry, client_id, connection_time_mono))
 
 def update_heartbeat(client_id: str):
     """
     Update the heartbeat for a client
     """
     if client_id in connected_clients:
-        connected_clients[client_id]['last_heartbeat'] = datetime.now()
+        connected_clients[client_id].last_heartbeat_mono = time.monotonic()
 
 def register_client(client_id: str, websocket, user_type: str):
     """
     Register a new client
     """
-    connected_clients[client_id] = {
-        'websocket': websocket,
-        'last_heartbeat': datetime.now(),
-        'connection_time': datetime.now(),
-        'user_type': user_type
-    }
+    now = time.monotonic()
+    connected_clients[client_id] = Client(
+        websocket=websocket,
+        last_heartbeat_mono=now,
+        connection_time_mono=now,
+        user_type=user_type
+    )
+    heapq.heappush(expiry_heap, (now + HEARTBEAT_TIMEOUT, client_id, now))
+    if user_type == 'parent':
+        parent_clients[client_id] = websocket
+    else:
+        child_clients[client_id] = websocket
     logger.info(f"✅ Registered client: {client_id} (Type: {user_type})")
 
 def remove_client(client_id: str):
@@ -54,4 +89,6 @@ def remove_client(client_id: str):
     """
     if client_id in connected_clients:
         del connected_clients[client_id]
+        parent_clients.pop(client_id, None)
+        child_clients.pop(client_id, None)
         logger.info(f"✅ Removed client: {client_id}")
\ No newline at end of file
@@ -0,0 +1,4 @@
+import os
+
+# Largest accepted WebSocket frame in bytes, shared by app.py and workers.py
+WS_MAX_SIZE = int(os.environ.get("WS_MAX_SIZE", "65536"))
\ No newline at end of file
@@ -0,0 +1,21 @@
+import time
+from datetime import datetime, timedelta
+
+# Cached ISO timestamp string, refreshed once per second
+_ts_cache = [0, ""]
+
+def iso_now():
+    """
+    Current local time as an ISO 8601 string, cached at 1-second granularity
+    """
+    now = int(time.time())
+    if _ts_cache[0] != now:
+        _ts_cache[0] = now
+        _ts_cache[1] = datetime.fromtimestamp(now).isoformat()
+    return _ts_cache[1]
+
+def monotonic_to_datetime(mono: float):
+    """
+    Convert a time.monotonic() reading to a wall-clock datetime for display
+    """
+    return datetime.now() - timedelta(seconds=time.monotonic() - mono)
\ No newline at end of file
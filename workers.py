@@ -0,0 +1,11 @@
+from uvicorn.workers import UvicornWorker
+from settings import WS_MAX_SIZE
+
+class WatchServerWorker(UvicornWorker):
+    """
+    Uvicorn worker for gunicorn with a bounded WebSocket frame size
+    """
+    CONFIG_KWARGS = {
+        **UvicornWorker.CONFIG_KWARGS,
+        "ws_max_size": WS_MAX_SIZE,
+    }
\ No newline at end of file